@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the BigQuery, Sheets, Analytics Reporting and Gmail REST
+endpoints used by the benchmark suite. Responses are synthetic and their size
+and latency are configurable, so benchmarks never touch the network.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlencode, urlsplit
+import multiprocessing
+import json
+import math
+import re
+import time
+
+import httplib2
+from googleapiclient.http import HttpRequest
+from googleapiclient.model import JsonModel
+
+STARTUP_TIMEOUT = 60
+
+
+class FakeApiConfig:
+    """Shape of the synthetic responses served by FakeGoogleApiServer
+    Args:
+      rows: int, rows in a BigQuery query response and in a full GA report
+      columns: int, columns per row; GA splits them between dimensions and metrics
+      value_width: int, characters in every synthetic cell value
+      latency: float, seconds slept by the server before answering each request"""
+
+    def __init__(self, rows=10000, columns=10, value_width=12, latency=0.0):
+        if(columns<2):
+            raise ValueError("columns must be at least 2 to hold GA dimensions and metrics")
+        self.rows = rows
+        self.columns = columns
+        self.value_width = value_width
+        self.latency = latency
+
+    def as_dict(self):
+        return {'rows':self.rows, 'columns':self.columns, 'value_width':self.value_width,
+                'latency':self.latency}
+
+
+def _cell(config, row_index, column_index):
+    return '{}.{}'.format(row_index, column_index).ljust(config.value_width, 'x')
+
+
+def _encode(payload):
+    return json.dumps(payload).encode('utf8')
+
+
+def _build_query_response(config):
+    """https://cloud.google.com/bigquery/docs/reference/rest/v2/jobs/query#response-body"""
+    fields = [{'name':'col_{}'.format(i), 'type':'STRING', 'mode':'NULLABLE'}
+              for i in range(config.columns)]
+    rows = [{'f':[{'v':_cell(config, r, c)} for c in range(config.columns)]}
+            for r in range(config.rows)]
+    return _encode({'kind':'bigquery#queryResponse', 'schema':{'fields':fields},
+                    'jobReference':{'projectId':'bench-project', 'jobId':'bench_job', 'location':'US'},
+                    'totalRows':str(config.rows), 'rows':rows,
+                    'totalBytesProcessed':str(config.rows*config.columns*config.value_width),
+                    'jobComplete':True, 'cacheHit':False})
+
+
+def _build_report_page(config, page_size, offset):
+    """https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet#Report
+    Page tokens are the row offset of the next page"""
+    num_dimensions = int(math.ceil(config.columns/2))
+    num_metrics = config.columns-num_dimensions
+    column_header = {'dimensions':['ga:dimension{}'.format(i) for i in range(num_dimensions)],
+                     'metricHeader':{'metricHeaderEntries':[{'name':'ga:metric{}'.format(i), 'type':'INTEGER'}
+                                                            for i in range(num_metrics)]}}
+    page_rows = []
+    for r in range(offset, min(offset+page_size, config.rows)):
+        page_rows.append({'dimensions':[_cell(config, r, c) for c in range(num_dimensions)],
+                          'metrics':[{'values':[str(r*num_metrics+c) for c in range(num_metrics)]}]})
+    report = {'columnHeader':column_header,
+              'data':{'rows':page_rows, 'rowCount':config.rows, 'isDataGolden':True}}
+    if(offset+page_size<config.rows):
+        report['nextPageToken'] = str(offset+page_size)
+    return _encode({'reports':[report]})
+
+
+class _FakeApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class _FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #Headers and body are written separately; with Nagle enabled every keep-alive
+    #response would stall on the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, content, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        stats = self.server.stats
+        with stats['lock']:
+            stats['requests'].value += 1
+            stats['bytes_sent'].value += len(content)
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with self.server.stats['lock']:
+            self.server.stats['bytes_received'].value += len(body)
+        return body
+
+    def _dispatch(self):
+        body = self._read_body()
+        if(self.server.config.latency):
+            time.sleep(self.server.config.latency)
+        path = urlsplit(self.path).path
+        for method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if(method==self.command and match):
+                try:
+                    return self._respond(handler(self, match, body))
+                except _FakeApiError as e:
+                    return self._respond(_encode({'error':{'code':e.code, 'message':str(e)}}), e.code)
+        self._respond(_encode({'error':{'code':404, 'message':'No fake route for {} {}'.format(self.command, path)}}), 404)
+
+    do_GET = do_POST = do_PUT = _dispatch
+
+    def _query(self, match, body):
+        return self.server.payloads['query']
+
+    def _insert_all(self, match, body):
+        return _encode({'kind':'bigquery#tableDataInsertAllResponse'})
+
+    def _batch_get(self, match, body):
+        report_request = json.loads(body)['reportRequests'][0]
+        page_key = (int(report_request.get('pageSize', 1000)), int(report_request.get('pageToken', 0)))
+        #Page tokens are offset+pageSize, so a pageSize below 1 would page forever
+        if(page_key[0]<1):
+            raise _FakeApiError(400, "pageSize must be at least 1, got {}".format(page_key[0]))
+        report_pages = self.server.payloads['report_pages']
+        if(page_key not in report_pages):
+            report_pages[page_key] = _build_report_page(self.server.config, *page_key)
+        return report_pages[page_key]
+
+    def _get_spreadsheet(self, match, body):
+        return _encode({'spreadsheetId':match.group('sid')})
+
+    def _batch_update(self, match, body):
+        return _encode({'spreadsheetId':match.group('sid'), 'replies':[{}]})
+
+    def _get_values(self, match, body):
+        return _encode({'range':match.group('range'), 'majorDimension':'ROWS'})
+
+    def _clear_values(self, match, body):
+        return _encode({'spreadsheetId':match.group('sid'), 'clearedRange':match.group('range')})
+
+    def _update_values(self, match, body):
+        return _encode({'spreadsheetId':match.group('sid'), 'updatedRange':match.group('range')})
+
+    def _send_message(self, match, body):
+        return _encode({'id':'bench_message', 'labelIds':['SENT']})
+
+    routes = [
+        ('POST', r'/bigquery/v2/projects/[^/]+/queries', _query),
+        ('POST', r'/bigquery/v2/projects/[^/]+/datasets/[^/]+/tables/[^/]+/insertAll', _insert_all),
+        ('POST', r'/v4/reports:batchGet', _batch_get),
+        ('POST', r'/v4/spreadsheets/(?P<sid>[^/]+):batchUpdate', _batch_update),
+        ('POST', r'/v4/spreadsheets/(?P<sid>[^/]+)/values/(?P<range>[^/]+):clear', _clear_values),
+        ('PUT', r'/v4/spreadsheets/(?P<sid>[^/]+)/values/(?P<range>[^/]+)', _update_values),
+        ('GET', r'/v4/spreadsheets/(?P<sid>[^/]+)/values/(?P<range>[^/]+)', _get_values),
+        ('GET', r'/v4/spreadsheets/(?P<sid>[^/:]+)', _get_spreadsheet),
+        ('POST', r'/gmail/v1/users/[^/]+/messages/send', _send_message),
+    ]
+
+
+def _serve(config, stats, port_pipe):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeApiHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.stats = stats
+    server.payloads = {'query':_build_query_response(config),
+                       'report_pages':{}}
+    port_pipe.send(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeGoogleApiServer:
+    """Serves the fake endpoints from a child process so the benchmarked client
+    code is timed and memory-profiled on its own
+    Args:
+      config: FakeApiConfig, shape of the synthetic responses"""
+
+    def __init__(self, config=None):
+        self.config = config or FakeApiConfig()
+        self.base_url = None
+        self._process = None
+        self._stats = {'lock':multiprocessing.Lock(),
+                       'requests':multiprocessing.Value('q', 0, lock=False),
+                       'bytes_sent':multiprocessing.Value('q', 0, lock=False),
+                       'bytes_received':multiprocessing.Value('q', 0, lock=False)}
+
+    def start(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(target=_serve, args=(self.config, self._stats, sender),
+                                                daemon=True)
+        self._process.start()
+        #Payloads are built before the port is sent, so large configs take a while to start
+        deadline = time.monotonic()+STARTUP_TIMEOUT
+        while(not receiver.poll(0.1)):
+            if(not self._process.is_alive()):
+                exitcode = self._process.exitcode
+                self.stop()
+                raise RuntimeError("Fake Google API server exited on startup with code {}".format(exitcode))
+            if(time.monotonic()>deadline):
+                self.stop()
+                raise RuntimeError("Fake Google API server did not start within {} seconds".format(STARTUP_TIMEOUT))
+        self.base_url = 'http://127.0.0.1:{}'.format(receiver.recv())
+        return self
+
+    def stop(self):
+        if(self._process is not None):
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """Returns dict of requests served, bytes sent and bytes received so far"""
+        with self._stats['lock']:
+            return {key:self._stats[key].value for key in ('requests', 'bytes_sent', 'bytes_received')}
+
+    def bigquery_service(self):
+        return FakeService(self.base_url, 'bigquery')
+
+    def sheets_service(self):
+        return FakeService(self.base_url, 'sheets')
+
+    def analytics_service(self):
+        return FakeService(self.base_url, 'analyticsreporting')
+
+    def gmail_service(self):
+        return FakeService(self.base_url, 'gmail')
+
+
+class _Resource:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class FakeService:
+    """Mimics the discovery resource objects returned by GService for the methods
+    this package calls. Requests are real googleapiclient HttpRequest objects sent
+    to the fake server, so transport and JSON decoding are part of every benchmark
+    Args:
+      base_url: str, root url of a running FakeGoogleApiServer
+      service_name: str, one of bigquery, sheets, analyticsreporting, gmail"""
+
+    def __init__(self, base_url, service_name):
+        self._base_url = base_url
+        self._http = httplib2.Http(proxy_info=None)
+        self._model = JsonModel(data_wrapper=False)
+        resources = {
+            'bigquery':{
+                'jobs':lambda: _Resource(
+                    query=lambda projectId, body: self._request(
+                        'POST', '/bigquery/v2/projects/{}/queries'.format(projectId), body=body)),
+                'tabledata':lambda: _Resource(
+                    insertAll=lambda projectId, datasetId, tableId, body: self._request(
+                        'POST', '/bigquery/v2/projects/{}/datasets/{}/tables/{}/insertAll'.format(
+                            projectId, datasetId, tableId), body=body))},
+            'sheets':{
+                'spreadsheets':lambda: _Resource(
+                    get=lambda spreadsheetId, ranges=None: self._request(
+                        'GET', '/v4/spreadsheets/{}'.format(spreadsheetId), query={'ranges':ranges}),
+                    batchUpdate=lambda spreadsheetId, body: self._request(
+                        'POST', '/v4/spreadsheets/{}:batchUpdate'.format(spreadsheetId), body=body),
+                    values=lambda: _Resource(
+                        get=lambda spreadsheetId, range: self._request(
+                            'GET', '/v4/spreadsheets/{}/values/{}'.format(spreadsheetId, quote(range, safe=''))),
+                        clear=lambda spreadsheetId, range, body=None: self._request(
+                            'POST', '/v4/spreadsheets/{}/values/{}:clear'.format(spreadsheetId, quote(range, safe='')),
+                            body=body or {}),
+                        update=lambda spreadsheetId, range, body, valueInputOption=None: self._request(
+                            'PUT', '/v4/spreadsheets/{}/values/{}'.format(spreadsheetId, quote(range, safe='')),
+                            query={'valueInputOption':valueInputOption}, body=body)))},
+            'analyticsreporting':{
+                'reports':lambda: _Resource(
+                    batchGet=lambda body: self._request('POST', '/v4/reports:batchGet', body=body))},
+            'gmail':{
+                'users':lambda: _Resource(
+                    messages=lambda: _Resource(
+                        send=lambda userId, body: self._request(
+                            'POST', '/gmail/v1/users/{}/messages/send'.format(userId), body=body)))},
+        }
+        self.__dict__.update(resources[service_name])
+
+    def _request(self, method, path, query=None, body=None):
+        query = {key:val for key, val in (query or {}).items() if val is not None}
+        uri = self._base_url+path+('?'+urlencode(query) if query else '')
+        headers = {'accept':'application/json'}
+        if(body is not None):
+            headers['content-type'] = 'application/json'
+            body = json.dumps(body)
+        return HttpRequest(self._http, self._model.response, uri, method=method, body=body, headers=headers)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for the parsing and batching code of gservice_api_tools.
+
+Every benchmark talks to a local FakeGoogleApiServer, reports throughput
+(rows/s, MB/s) and peak traced memory, and is compared against a recorded
+baseline so regressions are caught without network access.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks                  compare against benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline  record a baseline for the current parameters
+
+Baselines are kept per set of parameters (size, latency, page size) and Python
+version, so runs are compared only against a baseline recorded the same way.
+Absolute rows/s also depend on the machine: record baselines where the check runs.
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import gc
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from gservice_api_tools.gservice_analytics import GoogleAnalytics
+from gservice_api_tools.gservice_bigquery import Bigquery
+from gservice_api_tools.gservice_gmail import Gmail, Message
+from gservice_api_tools.gservice_sheets import Spreadsheet
+
+from benchmarks.fake_google_api import FakeApiConfig, FakeGoogleApiServer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+MB = 1024*1024
+MIN_RUN_SECONDS = 0.2
+
+
+def _synthetic_rows(config):
+    return [{'id':'row_{}'.format(r), 'payload':{'col_{}'.format(c):'{}.{}'.format(r, c).ljust(config.value_width, 'x')
+                                                 for c in range(config.columns-1)}}
+            for r in range(config.rows)]
+
+
+def bench_build_dataframe(server, options):
+    """Bigquery._build_dataframe_from_query_response on a fetched query response"""
+    config = server.config
+    bytes_before = server.stats()['bytes_sent']
+    query_response = server.bigquery_service().jobs().query(projectId='bench-project',
+                                                            body={'query':'SELECT 1'}).execute()
+    nbytes = server.stats()['bytes_sent']-bytes_before
+    return config.rows, nbytes, lambda: Bigquery._build_dataframe_from_query_response(query_response)
+
+
+def bench_stream_data(server, options):
+    """Bigquery.stream_data with insertId extraction, including the insertAll upload"""
+    config = server.config
+    bq = Bigquery(server.bigquery_service(), 'bench-project')
+    rows = _synthetic_rows(config)
+    return config.rows, None, lambda: bq.stream_data('bench_dataset', 'bench_table', rows=rows, insert_id_key='id')
+
+
+def _bench_fetch_report(server, options, num_days, fetch_by_day):
+    config = server.config
+    ga = GoogleAnalytics(server.analytics_service())
+    start_date = dt.datetime(2020, 1, 1)
+    end_date = start_date+dt.timedelta(num_days-1)
+
+    def run():
+        report_request_data = {'dimensions':[{'name':'ga:date'}], 'metrics':[{'expression':'ga:sessions'}]}
+        return ga.fetch_report('bench_view', report_request_data, date_range=(start_date, end_date),
+                               fetch_by_day=fetch_by_day, page_size=options.page_size)
+    #The fake server returns a full report for every request date range
+    return config.rows*num_days, None, run
+
+
+def bench_fetch_report(server, options):
+    """GoogleAnalytics.fetch_report paging through a full report for one date range"""
+    return _bench_fetch_report(server, options, num_days=1, fetch_by_day=False)
+
+
+def bench_fetch_report_by_day(server, options):
+    """GoogleAnalytics.fetch_report with fetch_by_day paging through a full report for each of 3 days"""
+    return _bench_fetch_report(server, options, num_days=3, fetch_by_day=True)
+
+
+def bench_push_dataframe(server, options):
+    """Spreadsheet.push_dataframe, including the values update upload"""
+    config = server.config
+    sheet = Spreadsheet(server.sheets_service(), 'bench_spreadsheet')
+    dataframe = pd.DataFrame([['{}.{}'.format(r, c).ljust(config.value_width, 'x') for c in range(config.columns)]
+                              for r in range(config.rows)],
+                             columns=['col_{}'.format(c) for c in range(config.columns)])
+    return config.rows, None, lambda: sheet.push_dataframe('Sheet1', dataframe, clear_all=True)
+
+
+def _bench_message(server, options):
+    config = server.config
+    attachment = os.path.join(options.workdir, 'attachment.bin')
+    if(not os.path.exists(attachment)):
+        with open(attachment, 'wb') as fp:
+            fp.write(os.urandom(config.rows*config.columns*config.value_width))
+    return Message('bench@example.com', 'bench@example.com', 'Benchmark', 'Benchmark body').with_attachment(attachment)
+
+
+def bench_b64_encode(server, options):
+    """Message.b64_encode of a message with a binary attachment (rows = messages)"""
+    message = _bench_message(server, options)
+    nbytes = len(message.b64_encode()['raw'])
+    return 1, nbytes, message.b64_encode
+
+
+def bench_send_email(server, options):
+    """Message.b64_encode followed by Gmail.send_email (rows = messages)"""
+    message = _bench_message(server, options)
+    gmail = Gmail(server.gmail_service(), 'me')
+    return 1, None, lambda: gmail.send_email(message.b64_encode())
+
+
+BENCHMARKS = {
+    'bigquery_build_dataframe':bench_build_dataframe,
+    'bigquery_stream_data':bench_stream_data,
+    'analytics_fetch_report':bench_fetch_report,
+    'analytics_fetch_report_by_day':bench_fetch_report_by_day,
+    'sheets_push_dataframe':bench_push_dataframe,
+    'gmail_b64_encode':bench_b64_encode,
+    'gmail_send_email':bench_send_email,
+}
+
+
+def _time_run(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter()-start)/calls
+
+
+def run_benchmarks(names, server, options):
+    """Returns dict of benchmark name to dict of throughput and peak memory
+    Args:
+      names: list of str, keys of BENCHMARKS
+      server: FakeGoogleApiServer, running server the benchmarks talk to
+      options: argparse.Namespace, parsed command line plus workdir for temporary files;
+        the median of options.repeat timed runs is reported"""
+
+    benchmarks = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in names:
+            rows, nbytes, func = BENCHMARKS[name](server, options)
+            #Fast benchmarks are called repeatedly in each timed run so that timer and
+            #scheduler noise do not dominate a single short call
+            calls = max(1, int(math.ceil(MIN_RUN_SECONDS/_time_run(func, 1))))
+            benchmarks[name] = {'rows':rows, 'nbytes':nbytes, 'func':func, 'calls':calls,
+                                'timings':[], 'traffic':0}
+
+        #Timed runs are interleaved across benchmarks so that slow drifts in machine
+        #load are spread over all of them instead of skewing one
+        for _ in range(options.repeat):
+            for bench in benchmarks.values():
+                gc.collect()
+                traffic_before = server.stats()
+                bench['timings'].append(_time_run(bench['func'], bench['calls']))
+                traffic_after = server.stats()
+                bench['traffic'] += sum(traffic_after[key]-traffic_before[key]
+                                        for key in ('bytes_sent', 'bytes_received'))
+
+        #Traced separately as tracemalloc slows down the timed runs
+        for bench in benchmarks.values():
+            tracemalloc.start()
+            try:
+                bench['func']()
+                bench['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    results = {}
+    for name, bench in benchmarks.items():
+        rows = bench['rows']
+        nbytes = bench['nbytes']
+        if(nbytes is None):
+            nbytes = bench['traffic']/(bench['calls']*options.repeat)
+        seconds = statistics.median(bench['timings'])
+        results[name] = {'rows':rows, 'mb':round(nbytes/MB, 3), 'seconds':round(seconds, 6),
+                         'rows_per_s':round(rows/seconds, 2), 'mb_per_s':round(nbytes/MB/seconds, 3),
+                         'peak_mb':round(bench['peak_memory']/MB, 3)}
+    return results
+
+
+def find_baseline(baselines, bench_config, python_version):
+    """Returns the baseline entry recorded with bench_config on python_version, None if there is none
+    Args:
+      baselines: list of dict, entries of config, python version and results per benchmark
+      bench_config: dict, fake server config plus GA page size of the current run
+      python_version: str, interpreter version of the current run; absolute rows/s are
+        only comparable on the interpreter (and machine) they were recorded on"""
+    for baseline in baselines:
+        if(baseline['config']==bench_config and baseline['python']==python_version):
+            return baseline
+    return None
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Returns list of regression messages; throughput may drop and peak memory
+    may grow by at most tolerance (a fraction) relative to the baseline"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline['results'].get(name)
+        if(expected is None):
+            continue
+        if(result['rows_per_s']<expected['rows_per_s']*(1-tolerance)):
+            regressions.append("{}: {:.2f} rows/s is below baseline {:.2f} rows/s".format(
+                name, result['rows_per_s'], expected['rows_per_s']))
+        if(result['peak_mb']>expected['peak_mb']*(1+tolerance)):
+            regressions.append("{}: peak memory {:.3f} MB is above baseline {:.3f} MB".format(
+                name, result['peak_mb'], expected['peak_mb']))
+    return regressions
+
+
+def print_results(results):
+    print('{:<32}{:>9}{:>10}{:>14}{:>10}{:>10}'.format('benchmark', 'rows', 'MB', 'rows/s', 'MB/s', 'peak MB'))
+    for name, result in results.items():
+        print('{:<32}{:>9}{:>10.3f}{:>14.2f}{:>10.3f}{:>10.3f}'.format(
+            name, result['rows'], result['mb'], result['rows_per_s'], result['mb_per_s'], result['peak_mb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local fake Google API server")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--value-width', type=int, default=12)
+    parser.add_argument('--page-size', type=int, default=1000, help="GA report rows per page")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of server latency per request")
+    parser.add_argument('--repeat', type=int, default=9, help="timed runs per benchmark; the median is reported")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="run a subset of benchmarks")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="record results as the baseline for these parameters")
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help="allowed fractional throughput drop / peak memory growth vs baseline")
+    args = parser.parse_args(argv)
+    if(args.rows<1):
+        parser.error("--rows must be at least 1")
+    if(args.columns<2):
+        parser.error("--columns must be at least 2 to hold GA dimensions and metrics")
+    if(args.value_width<1):
+        parser.error("--value-width must be at least 1")
+    if(args.page_size<1):
+        parser.error("--page-size must be at least 1")
+    if(args.latency<0):
+        parser.error("--latency must not be negative")
+    if(args.repeat<1):
+        parser.error("--repeat must be at least 1")
+    if(not 0<=args.tolerance<1):
+        parser.error("--tolerance must be a fraction in [0, 1)")
+
+    config = FakeApiConfig(rows=args.rows, columns=args.columns, value_width=args.value_width,
+                           latency=args.latency)
+    bench_config = dict(config.as_dict(), page_size=args.page_size)
+    with FakeGoogleApiServer(config) as server, tempfile.TemporaryDirectory() as args.workdir:
+        results = run_benchmarks(args.only or list(BENCHMARKS), server, args)
+    print_results(results)
+
+    baselines = []
+    if(os.path.exists(args.baseline)):
+        with open(args.baseline) as fp:
+            baselines = json.load(fp)['baselines']
+    python_version = sys.version.split()[0]
+    baseline = find_baseline(baselines, bench_config, python_version)
+
+    if(args.save_baseline):
+        #Merge so that saving a subset (--only) keeps the other benchmarks' baselines
+        if(baseline is None):
+            baseline = {'config':bench_config, 'python':python_version, 'results':{}}
+            baselines.append(baseline)
+        baseline['results'].update(results)
+        with open(args.baseline, 'w') as fp:
+            json.dump({'baselines':baselines}, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+        print("Saved baseline to {}".format(args.baseline))
+        return 0
+
+    if(baseline is None):
+        other_versions = sorted(entry['python'] for entry in baselines if entry['config']==bench_config)
+        if(other_versions):
+            print("WARNING baseline for {} was recorded on Python {}, not {}; rows/s from another "
+                  "interpreter or machine are not comparable".format(bench_config, ', '.join(other_versions),
+                                                                     python_version))
+        print("No baseline for {} on Python {} in {}; run with --save-baseline to record one".format(
+            bench_config, python_version, args.baseline))
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION {}".format(regression))
+    if(not regressions):
+        print("No regressions against {} (tolerance {:.0%})".format(args.baseline, args.tolerance))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,9 +7,6 @@
 import datetime as dt
 import pandas as pd
 
-google_analytics_scopes = ['https://www.googleapis.com/auth/analytics.readonly']
-analytics_service = GService('analyticsreporting','v4',google_analytics_scopes).oauth('OAuthCredentials.json')
-
 class GoogleAnalytics:
     """Fetch and store google analytics reports"""
     
@@ -25,7 +22,7 @@ class GoogleAnalytics:
         https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet#ColumnHeader"""
         headers = []
         headers.extend(column_header['dimensions'])
-        headers.extend([metric_header['name'] for metric_header in column_header['metricHeaderEntries']])
+        headers.extend([metric_header['name'] for metric_header in column_header['metricHeader']['metricHeaderEntries']])
         return headers
     
     @staticmethod
@@ -42,7 +39,7 @@ class GoogleAnalytics:
     
     def _fetch_report(self, request_body):
         """Makes the API call and returns a tuple of headers and rows"""
-        return self._analytics.reports.batchGet(body=request_body).execute()
+        return self._analytics.reports().batchGet(body=request_body).execute()
         
     
     def fetch_report(self, view_id, report_request_data, date_range=None, fetch_by_day=True,
@@ -89,14 +86,15 @@ class GoogleAnalytics:
             for i in range(num_days):
                 query_date = (start_date+dt.timedelta(i)).strftime('%Y-%m-%d')
                 report_request['reportRequests'][0]['dateRanges']=[{'startDate':query_date,'endDate':query_date}]
+                report_request['reportRequests'][0].pop('pageToken',None)
                 
                 while True:
                     report_response = self._fetch_report(report_request)
-                    report_rows = self._parse_rows(report_response['reports'][0]['data']['rows'])
+                    report_rows = self._parse_report_rows(report_response['reports'][0]['data'].get('rows',[]))
                     result_rows.extend(report_rows)
                     
-                    if(bool(report_response.get('nextPageToken'))):
-                        report_request['reportRequests'][0]['pageToken'] = report_response['nextPageToken']
+                    if(bool(report_response['reports'][0].get('nextPageToken'))):
+                        report_request['reportRequests'][0]['pageToken'] = report_response['reports'][0]['nextPageToken']
                     else:
                         break
                 print("Completed data pull for {}".format(query_date))
@@ -112,11 +110,11 @@ class GoogleAnalytics:
             
             while True:
                 report_response = self._fetch_report(report_request)
-                report_rows = self._parse_rows(report_response['reports'][0]['data']['rows'])
+                report_rows = self._parse_report_rows(report_response['reports'][0]['data'].get('rows',[]))
                 result_rows.extend(report_rows)
                 
-                if(bool(report_response.get('nextPageToken'))):
-                    report_request['reportRequests'][0]['pageToken'] = report_response['nextPageToken']
+                if(bool(report_response['reports'][0].get('nextPageToken'))):
+                    report_request['reportRequests'][0]['pageToken'] = report_response['reports'][0]['nextPageToken']
                 else:
                     break
             print("Completed data pull for {}-{}".format(start_date.strftime('%Y-%m-%d'),end_date.strftime('%Y-%m-%d')))